@@ -2,6 +2,8 @@
 
 import os
 
+import io
+
 import re
 
 import subprocess
@@ -10,13 +12,11 @@ import argparse
 
 import logging
 
-from typing import List, Set, Dict
-
-from pathlib import Path
+from typing import List, Set, Dict, Tuple, TextIO, Optional
 
 from concurrent.futures import ThreadPoolExecutor
 
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import json
 
@@ -28,6 +28,56 @@ import fnmatch
 
 import shutil
 
+import threading
+
+import queue
+
+import string
+
+from urllib.request import pathname2url
+
+
+
+try:
+
+    import ahocorasick
+
+except ImportError:
+
+    ahocorasick = None
+
+
+
+# Precompiled patterns used for every processed class
+
+_RE_WS = re.compile(r'\s+')
+
+# String/char literals are matched first so that '//' inside them survives
+
+_RE_CODE_NOISE = re.compile(
+
+    r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')'
+
+    r'|(?:\s|//[^\n]*|/\*.*?\*/)+',
+
+    re.DOTALL
+
+)
+
+_RE_EXTENDS = re.compile(r'extends\s+([A-Za-z0-9_.]+)')
+
+_RE_IMPLEMENTS = re.compile(r'implements\s+([A-Za-z0-9_.,\s]+)')
+
+_RE_CLASSREF = re.compile(r'([A-Za-z0-9_]+\.[A-Za-z0-9_.]+)')
+
+_RE_IDENT = re.compile(r'\b[A-Za-z_][A-Za-z0-9_]*\b')
+
+_RE_IMPORT = re.compile(r'\bimport\s+(?:static\s+)?([A-Za-z0-9_.]+?)(\.\*)?\s*;')
+
+_IDENT_CHARS = frozenset(string.ascii_letters + string.digits + '_')
+
+_RE_TOKEN = re.compile(r'\w+|[^\w\s]')
+
 
 
 class JadxContextGenerator:
@@ -60,10 +110,30 @@ class JadxContextGenerator:
 
         
 
-        # Initialize SQLite connection
+        # In-memory copies of the class index for fast lookups
+
+        self._class_map: Dict[str, str] = {}
+
+        self._simple_map: Dict[str, List[str]] = defaultdict(list)
+
+        self._simple_names: Set[str] = set()
+
+        self._ac = None
+
+        
+
+        # Initialize SQLite connection, plus one read-only connection per thread
+
+        # for querying the finished index
 
         self.conn = None
 
+        self._local = threading.local()
+
+        self._read_conns: Dict[threading.Thread, sqlite3.Connection] = {}
+
+        self._read_conns_lock = threading.Lock()
+
         self.setup_index_db()
 
 
@@ -74,16 +144,28 @@ class JadxContextGenerator:
 
         try:
 
-            # Remove existing database if it exists
+            # Remove existing database (and any leftover WAL files) if it exists
 
-            if os.path.exists(self.index_db):
+            for db_file in (self.index_db, self.index_db + "-wal", self.index_db + "-shm"):
 
-                os.remove(self.index_db)
+                if os.path.exists(db_file):
+
+                    os.remove(db_file)
 
                 
 
             self.conn = sqlite3.connect(self.index_db)
 
+            # The index is rebuilt on every run, so durability can be traded for speed
+
+            self.conn.execute("PRAGMA journal_mode=WAL")
+
+            self.conn.execute("PRAGMA synchronous=OFF")
+
+            self.conn.execute("PRAGMA temp_store=MEMORY")
+
+            self.conn.execute("PRAGMA cache_size=-200000")
+
             cursor = self.conn.cursor()
 
             
@@ -98,7 +180,11 @@ class JadxContextGenerator:
 
                     file_path TEXT,
 
-                    package TEXT
+                    package TEXT,
+
+                    cleaned BLOB,
+
+                    token_count INTEGER
 
                 )
 
@@ -130,6 +216,8 @@ class JadxContextGenerator:
 
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_references ON class_references(source_class, target_class)')
 
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_ref_target ON class_references(target_class)')
+
             
 
             self.conn.commit()
@@ -186,25 +274,65 @@ class JadxContextGenerator:
 
             self.logger.info(f"Running jadx command: {' '.join(cmd)}")
 
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            # Stream output to the logger as it arrives instead of buffering it all;
 
-            
+            # stdout is only wanted for debug logging, stderr is always reported
+
+            log_stdout = self.logger.isEnabledFor(logging.DEBUG)
+
+            proc = subprocess.Popen(
+
+                cmd,
+
+                stdout=subprocess.PIPE if log_stdout else subprocess.DEVNULL,
+
+                stderr=subprocess.PIPE,
+
+                text=True,
+
+                errors='replace',
 
-            if result.stdout:
+                bufsize=1
 
-                self.logger.debug(f"jadx stdout:\n{result.stdout}")
+            )
 
-            if result.stderr:
+            readers = [threading.Thread(target=self._forward_output,
 
-                self.logger.error(f"jadx stderr:\n{result.stderr}")
+                                        args=(proc.stderr, "jadx stderr", self.logger.error))]
 
+            if log_stdout:
 
+                readers.append(threading.Thread(target=self._forward_output,
 
-            # Check if decompilation succeeded
+                                                args=(proc.stdout, "jadx stdout", self.logger.debug)))
 
-            java_files = list(Path(self.output_dir).rglob("*.java"))
+            for reader in readers:
 
-            if not java_files:
+                reader.start()
+
+            proc.wait()
+
+            for reader in readers:
+
+                reader.join()
+
+
+
+            # Check if decompilation succeeded, keeping a few files to sample
+
+            java_file_count = 0
+
+            sample_files = []
+
+            for file in self._iter_java(self.output_dir):
+
+                java_file_count += 1
+
+                if len(sample_files) < 5:
+
+                    sample_files.append(file)
+
+            if not java_file_count:
 
                 self.logger.error("No Java files found after decompilation!")
 
@@ -228,13 +356,13 @@ class JadxContextGenerator:
 
 
 
-            self.logger.info(f"Found {len(java_files)} Java files")
+            self.logger.info(f"Found {java_file_count} Java files")
 
             
 
             # Sample the first few files to verify content
 
-            for file in java_files[:5]:
+            for file in sample_files:
 
                 self.logger.debug(f"Sample file: {file}")
 
@@ -268,7 +396,91 @@ class JadxContextGenerator:
 
 
 
-    def _build_class_index(self):
+    def _read_conn(self) -> sqlite3.Connection:
+
+        """Get the calling thread's read-only connection to the index database."""
+
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+
+            # check_same_thread is off only so that cleanup() can close it
+
+            conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(self.index_db))}?mode=ro",
+
+                                   uri=True, check_same_thread=False)
+
+            self._local.conn = conn
+
+            with self._read_conns_lock:
+
+                self._read_conns[threading.current_thread()] = conn
+
+        return conn
+
+
+
+    def _close_read_conns(self, keep_current: bool = False):
+
+        """Close the read-only connections, except the calling thread's if keep_current is set."""
+
+        current = threading.current_thread()
+
+        with self._read_conns_lock:
+
+            for thread, conn in list(self._read_conns.items()):
+
+                if keep_current and thread is current:
+
+                    continue
+
+                conn.close()
+
+                del self._read_conns[thread]
+
+        if not keep_current:
+
+            self._local.conn = None
+
+
+
+    def _forward_output(self, stream, label: str, log):
+
+        """Forward lines from a subprocess pipe to the given log function."""
+
+        with stream:
+
+            for line in stream:
+
+                log(f"{label}: {line.rstrip()}")
+
+
+
+    def _clean_class_file(self, file_path: str) -> Tuple[Optional[bytes], int]:
+
+        """Read and optimize a class file, returning the cleaned text and its token count."""
+
+        try:
+
+            with open(file_path, 'rb') as f:
+
+                content = f.read().decode('utf-8', errors='replace')
+
+        except Exception as e:
+
+            self.logger.warning(f"Error reading {file_path}: {str(e)}")
+
+            return None, 0
+
+            
+
+        optimized_content = self.optimize_code_tokens(content)
+
+        return optimized_content.encode('utf-8'), self.calculate_tokens(optimized_content)
+
+
+
+    def _build_class_index(self, batch_size: int = 5000, max_workers: int = None):
 
         """Build index of all decompiled classes with enhanced path handling."""
 
@@ -276,157 +488,531 @@ class JadxContextGenerator:
 
         
 
-        # Search in multiple possible locations
+        # The candidate locations nest inside output_dir, so only walk the first
+
+        # one that exists and fall back to the whole output directory
 
-        search_paths = [
+        for candidate in (os.path.join(self.output_dir, 'sources'),
 
-            os.path.join(self.output_dir, 'sources'),
+                          os.path.join(self.output_dir, 'src', 'main', 'java')):
 
-            os.path.join(self.output_dir, 'src', 'main', 'java'),
+            if os.path.isdir(candidate):
 
-            self.output_dir,
+                search_path = candidate
 
-        ]
+                break
+
+        else:
+
+            search_path = self.output_dir
 
         
 
+        if max_workers is None:
+
+            max_workers = min(32, (os.cpu_count() or 1) * 4)
+
         cursor = self.conn.cursor()
 
-        total_files = 0
+        cursor.execute("BEGIN")
+
+        total_classes = 0
 
         
 
-        for search_path in search_paths:
+        self.logger.info(f"Searching in: {search_path}")
 
-            if not os.path.exists(search_path):
+        # _iter_java yields paths prefixed by search_path and a separator
 
-                self.logger.debug(f"Path does not exist: {search_path}")
+        prefix_len = len(search_path) + 1
 
-                continue
+        java_files = self._iter_java(search_path)
 
-                
+        java_files_lock = threading.Lock()
 
-            self.logger.info(f"Searching in: {search_path}")
+        rows = queue.Queue(maxsize=10000)
 
-            java_files = list(Path(search_path).rglob("*.java"))
+        # Set when the writer stops draining, so producers don't block on a full queue
 
-            
+        stop = threading.Event()
+
+        
 
-            for file_path in tqdm(java_files, desc=f"Indexing classes in {search_path}"):
+        def put(item) -> bool:
+
+            while not stop.is_set():
 
                 try:
 
-                    relative_path = file_path.relative_to(search_path)
+                    rows.put(item, timeout=0.1)
 
-                    class_name = str(relative_path.with_suffix('')).replace(os.sep, '.')
+                    return True
 
-                    package = '.'.join(class_name.split('.')[:-1])
+                except queue.Full:
 
-                    
+                    continue
+
+            return False
 
-                    cursor.execute(
+        
 
-                        'INSERT OR REPLACE INTO class_index (class_name, file_path, package) VALUES (?, ?, ?)',
+        def produce():
 
-                        (class_name, str(file_path), package)
+            # Workers share the scandir walk and read and optimize each class they
 
-                    )
+            # take from it, the None sentinel tells the writer they are done
 
-                    total_files += 1
+            try:
 
-                except Exception as e:
+                while not stop.is_set():
+
+                    with java_files_lock:
+
+                        file_path = next(java_files, None)
+
+                    if file_path is None:
+
+                        break
+
+                    try:
+
+                        # Strip the search path prefix and the '.java' suffix
+
+                        class_name = file_path[prefix_len:-5].replace(os.sep, '.')
+
+                        package = '.'.join(class_name.split('.')[:-1])
+
+                        row = (class_name, file_path, package) + self._clean_class_file(file_path)
+
+                    except Exception as e:
+
+                        self.logger.warning(f"Error indexing {file_path}: {str(e)}")
+
+                        continue
+
+                    if not put(row):
+
+                        break
+
+            finally:
+
+                put(None)
+
+        
+
+        # The current thread is the only one writing to SQLite
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            producers = [executor.submit(produce) for _ in range(max_workers)]
+
+            finished = 0
+
+            batch = []
+
+            progress = tqdm(desc=f"Indexing classes in {search_path}")
+
+            try:
+
+                while finished < len(producers):
+
+                    row = rows.get()
+
+                    if row is None:
+
+                        finished += 1
+
+                        continue
 
-                    self.logger.warning(f"Error indexing {file_path}: {str(e)}")
+                    batch.append(row)
+
+                    if len(batch) >= batch_size:
+
+                        cursor.executemany(
+
+                            'INSERT OR REPLACE INTO class_index (class_name, file_path, package, cleaned, token_count) '
+
+                            'VALUES (?, ?, ?, ?, ?)',
+
+                            batch
+
+                        )
+
+                        total_classes += len(batch)
+
+                        progress.update(len(batch))
+
+                        batch = []
+
+                cursor.executemany(
+
+                    'INSERT OR REPLACE INTO class_index (class_name, file_path, package, cleaned, token_count) '
+
+                    'VALUES (?, ?, ?, ?, ?)',
+
+                    batch
+
+                )
+
+                total_classes += len(batch)
+
+                progress.update(len(batch))
+
+            except BaseException:
+
+                # Release the producers before the executor waits for them
+
+                stop.set()
+
+                self.conn.rollback()
+
+                raise
+
+            finally:
+
+                progress.close()
+
+            
+
+            # Surface any error a producer hit while walking
+
+            for producer in producers:
+
+                producer.result()
 
         
 
         self.conn.commit()
 
-        self.logger.info(f"Indexed {total_files} classes")
+        self.logger.info(f"Indexed {total_classes} classes")
 
+        
 
+        self._load_class_maps()
 
-    def find_class_file(self, class_name: str) -> str:
+        self._build_reference_index()
 
-        """Find the .java file for a given class name with enhanced debugging."""
 
-        self.logger.debug(f"Looking for class file: {class_name}")
+
+    def _load_class_maps(self):
+
+        """Load the class index into memory for find_class_file."""
+
+        cursor = self.conn.cursor()
+
+        self._class_map = dict(cursor.execute('SELECT class_name, file_path FROM class_index'))
+
+        self._simple_map = defaultdict(list)
+
+        for class_name in self._class_map:
+
+            self._simple_map[class_name.split('.')[-1].lower()].append(class_name)
+
+        self._simple_names = {class_name.split('.')[-1] for class_name in self._class_map}
 
         
 
-        # Try database first
+        # Aho-Corasick automaton over every known name, if pyahocorasick is installed
 
-        if self.conn:
+        if ahocorasick is not None and self._class_map:
 
-            cursor = self.conn.cursor()
+            self._ac = ahocorasick.Automaton()
+
+            for name in self._simple_names.union(self._class_map):
+
+                self._ac.add_word(name, name)
+
+            self._ac.make_automaton()
+
+
+
+    def _build_reference_index(self, batch_size: int = 50000):
 
-            cursor.execute('SELECT file_path FROM class_index WHERE class_name = ?', (class_name,))
+        """Record which indexed class names each class mentions."""
 
-            result = cursor.fetchone()
+        cursor = self.conn.cursor()
+
+        # Scan the cleaned text stored by _build_class_index instead of the source files
 
-            if result:
+        classes = self.conn.execute('SELECT class_name, cleaned FROM class_index WHERE cleaned IS NOT NULL')
 
-                self.logger.debug(f"Found in database: {result[0]}")
+        cursor.execute("BEGIN")
 
-                return result[0]
+        rows = []
+
+        total_refs = 0
 
         
 
-        # List all possible paths to search
+        for class_name, cleaned_content in tqdm(classes, total=len(self._class_map), desc="Indexing class references"):
+
+            content = cleaned_content.decode('utf-8')
 
-        search_paths = [
+            rows.extend((class_name, target, 'ref') for target in self._extract_references(content))
 
-            os.path.join(self.output_dir, 'sources'),
+            if len(rows) >= batch_size:
 
-            os.path.join(self.output_dir, 'src', 'main', 'java'),
+                cursor.executemany(
 
-            os.path.join(self.output_dir),
+                    'INSERT OR IGNORE INTO class_references (source_class, target_class, reference_type) VALUES (?, ?, ?)',
+
+                    rows
+
+                )
 
-        ]
+                total_refs += len(rows)
+
+                rows = []
 
         
 
-        # Log all Java files found
+        cursor.executemany(
+
+            'INSERT OR IGNORE INTO class_references (source_class, target_class, reference_type) VALUES (?, ?, ?)',
+
+            rows
+
+        )
+
+        total_refs += len(rows)
+
+        self.conn.commit()
+
+        self.logger.info(f"Indexed {total_refs} class references")
+
+
+
+    def _extract_references(self, content: str) -> Set[str]:
+
+        """Find the indexed qualified and simple class names mentioned in content."""
+
+        if self._ac is None:
+
+            references = set()
+
+            for ref in _RE_CLASSREF.findall(content):
+
+                # The match runs on into member access, keep its longest indexed prefix
+
+                ref = ref.rstrip('.')
+
+                while ref not in self._class_map and '.' in ref:
+
+                    ref = ref.rsplit('.', 1)[0]
+
+                if ref in self._class_map:
+
+                    references.add(ref)
+
+            references.update(self._simple_names.intersection(_RE_IDENT.findall(content)))
+
+            return references
+
+            
+
+        references = set()
+
+        content_len = len(content)
+
+        for end, name in self._ac.iter(content):
+
+            # Only accept whole identifiers, not substrings of longer ones
+
+            start = end - len(name) + 1
+
+            if start > 0 and content[start - 1] in _IDENT_CHARS:
+
+                continue
+
+            if end + 1 < content_len and content[end + 1] in _IDENT_CHARS:
+
+                continue
+
+            references.add(name)
+
+        return references
+
+
+
+    def _parse_imports(self, content: str) -> Tuple[Dict[str, str], Set[str]]:
+
+        """Get the single-type imports (by simple name) and wildcard packages of a class."""
+
+        imports = {}
+
+        wildcard_packages = set()
+
+        for name, wildcard in _RE_IMPORT.findall(content):
+
+            if wildcard:
+
+                wildcard_packages.add(name)
+
+            else:
+
+                imports[name.split('.')[-1]] = name
+
+        return imports, wildcard_packages
+
+
+
+    def _resolve_type_name(self, name: str, package: str = '', imports: Dict[str, str] = None,
+
+                           wildcard_packages: Set[str] = None) -> Optional[str]:
+
+        """Map a referenced name to an indexed class name, or None if it is unknown or ambiguous."""
+
+        if name in self._class_map:
+
+            return name
+
+        candidates = [c for c in self._simple_map.get(name.lower(), []) if c.split('.')[-1] == name]
+
+        if len(candidates) <= 1:
+
+            return candidates[0] if candidates else None
+
+            
+
+        # Ambiguous simple name, use Java's precedence: single-type import,
+
+        # then the class's own package, then wildcard imports
+
+        if imports and imports.get(name) in candidates:
+
+            return imports[name]
+
+        if package and f"{package}.{name}" in candidates:
+
+            return f"{package}.{name}"
+
+        if wildcard_packages:
+
+            imported = [c for c in candidates if c.rsplit('.', 1)[0] in wildcard_packages]
+
+            if len(imported) == 1:
+
+                return imported[0]
+
+        return None
+
+
+
+    def _resolve_references(self, references: Set[str], package: str = '', imports: Dict[str, str] = None,
+
+                            wildcard_packages: Set[str] = None) -> Set[str]:
+
+        """Map referenced names to indexed class names, skipping unresolvable ones."""
+
+        resolved = set()
+
+        for ref in references:
+
+            indexed_name = self._resolve_type_name(ref, package, imports, wildcard_packages)
+
+            if indexed_name:
+
+                resolved.add(indexed_name)
+
+        return resolved
+
+
+
+    def _iter_java(self, root: str):
+
+        """Yield paths of all .java files under root using os.scandir."""
+
+        stack = [root]
+
+        while stack:
+
+            directory = stack.pop()
+
+            try:
+
+                it = os.scandir(directory)
+
+            except OSError:
+
+                continue
+
+            with it:
+
+                for entry in it:
+
+                    if entry.is_dir(follow_symlinks=False):
+
+                        stack.append(entry.path)
+
+                    elif entry.name.endswith('.java'):
+
+                        yield entry.path
+
+
+
+    def find_class_file(self, class_name: str) -> Optional[str]:
+
+        """Find the .java file for a given class name with enhanced debugging."""
+
+        self.logger.debug(f"Looking for class file: {class_name}")
 
-        self.logger.debug("Searching for Java files in:")
+        
 
-        for search_path in search_paths:
+        indexed_name = self._resolve_class_name(class_name)
 
-            if os.path.exists(search_path):
+        if indexed_name:
 
-                self.logger.debug(f"Searching in: {search_path}")
+            self.logger.debug(f"Found in index: {self._class_map[indexed_name]}")
 
-                java_files = list(Path(search_path).rglob("*.java"))
+            return self._class_map[indexed_name]
 
-                self.logger.debug(f"Found {len(java_files)} Java files")
+        
 
-                for java_file in java_files:
+        self.logger.warning(f"Class file not found for {class_name} in the class index")
 
-                    self.logger.debug(f"Found file: {java_file}")
+        return None
 
-                    # Convert path to class name
 
-                    relative_path = java_file.relative_to(search_path)
 
-                    potential_class_name = str(relative_path.with_suffix('')).replace(os.sep, '.')
+    def _resolve_class_name(self, class_name: str) -> Optional[str]:
 
-                    if class_name.lower() in potential_class_name.lower():  # Case-insensitive comparison
+        """Map a class name to its name in the class index."""
 
-                        self.logger.debug(f"Matched class name: {potential_class_name}")
+        if class_name in self._class_map:
 
-                        return str(java_file)
+            return class_name
 
         
 
-        self.logger.warning(f"Class file not found for {class_name} in any search path")
+        # Fall back to a case-insensitive match, keeping the package if one was given
+
+        package, _, simple_name = class_name.rpartition('.')
+
+        candidates = self._simple_map.get(simple_name.lower(), [])
+
+        if package:
+
+            candidates = [c for c in candidates if c.rpartition('.')[0].lower() == package.lower()]
+
+        if len(candidates) > 1:
+
+            self.logger.warning(f"Ambiguous class name {class_name}, matches {', '.join(candidates)}")
+
+            return None
+
+        if candidates:
+
+            self.logger.debug(f"Matched class name: {candidates[0]}")
+
+            return candidates[0]
 
         return None
 
 
 
-    def get_class_hierarchy(self, class_name: str) -> Dict:
+    def get_class_hierarchy(self, class_name: str, content: str = None) -> Dict:
 
-        """Get class hierarchy information."""
+        """Get class hierarchy information, from content if it was already loaded."""
 
         hierarchy = {
 
@@ -444,11 +1030,11 @@ class JadxContextGenerator:
 
         
 
-        class_file = self.find_class_file(class_name)
+        if content is None:
 
-        if not class_file:
+            content, _ = self.get_optimized_content(class_name)
 
-            self.logger.warning(f"Class file not found for {class_name}")
+        if not content:
 
             return hierarchy
 
@@ -456,39 +1042,57 @@ class JadxContextGenerator:
 
         try:
 
-            with open(class_file, 'r', encoding='utf-8') as f:
+            # Source names are resolved against the class's package and imports;
 
-                content = f.read()
+            # names that cannot be resolved are kept as written
 
-                
+            indexed_name = self._resolve_class_name(class_name)
+
+            package = indexed_name.rsplit('.', 1)[0] if '.' in indexed_name else ''
+
+            imports, wildcard_packages = self._parse_imports(content)
+
+            
 
             # Extract superclass
 
-            super_match = re.search(r'extends\s+([A-Za-z0-9_.]+)', content)
+            super_match = _RE_EXTENDS.search(content)
 
             if super_match:
 
-                hierarchy['superclasses'].append(super_match.group(1))
+                superclass = super_match.group(1)
+
+                hierarchy['superclasses'].append(
+
+                    self._resolve_type_name(superclass, package, imports, wildcard_packages) or superclass)
 
                 
 
             # Extract interfaces
 
-            interface_match = re.search(r'implements\s+([A-Za-z0-9_.,\s]+)', content)
+            interface_match = _RE_IMPLEMENTS.search(content)
 
             if interface_match:
 
                 interfaces = [i.strip() for i in interface_match.group(1).split(',')]
 
-                hierarchy['interfaces'].extend(interfaces)
+                hierarchy['interfaces'].extend(
+
+                    self._resolve_type_name(i, package, imports, wildcard_packages) or i for i in interfaces if i)
 
                 
 
-            # Find referenced classes
+            # Find referenced classes, already extracted by _build_reference_index
+
+            cursor = self._read_conn().cursor()
+
+            cursor.execute('SELECT target_class FROM class_references WHERE source_class = ?', (indexed_name,))
+
+            class_refs = {target_class for target_class, in cursor.fetchall()}
 
-            class_refs = re.findall(r'([A-Za-z0-9_]+\.[A-Za-z0-9_.]+)', content)
+            hierarchy['referenced_classes'].update(
 
-            hierarchy['referenced_classes'].update(class_refs)
+                self._resolve_references(class_refs, package, imports, wildcard_packages))
 
             
 
@@ -524,35 +1128,17 @@ class JadxContextGenerator:
 
 
 
-        cursor = self.conn.cursor()
-
-        cursor.execute('SELECT file_path FROM class_index')
-
-        files = cursor.fetchall()
-
-        
-
-        for file_path, in tqdm(files, desc=f"Tracing usage of {class_name}"):
-
-            try:
-
-                with open(file_path, 'r', encoding='utf-8') as f:
-
-                    content = f.read()
-
-                    
-
-                if class_name in content or class_simple_name in content:
+        cursor = self._read_conn().cursor()
 
-                    relative_path = str(Path(file_path).relative_to(self.output_dir).with_suffix('')).replace(os.sep, '.')
+        cursor.execute(
 
-                    usage_classes.add(relative_path)
+            'SELECT DISTINCT source_class FROM class_references WHERE target_class IN (?, ?)',
 
-                    
+            (class_name, class_simple_name)
 
-            except Exception as e:
+        )
 
-                self.logger.warning(f"Error processing {file_path}: {str(e)}")
+        usage_classes.update(source_class for source_class, in cursor.fetchall())
 
                 
 
@@ -588,59 +1174,89 @@ class JadxContextGenerator:
 
 
 
-    def get_class_content(self, class_name: str) -> str:
+    def get_allowed_classes(self, whitelist: List[str], blacklist: List[str]) -> Set[str]:
 
-        """Get the content of a class file."""
+        """Get all indexed classes that pass the whitelist/blacklist rules."""
 
-        class_file = self.find_class_file(class_name)
+        # GLOB uses the same wildcards as fnmatch, except for negated sets
 
-        if not class_file:
+        clauses = []
 
-            self.logger.warning(f"Class file not found for {class_name}")
+        params = []
+
+        if whitelist:
 
-            return ""
+            clauses.append('(' + ' OR '.join(['class_name GLOB ?'] * len(whitelist)) + ')')
+
+            params.extend(white.replace('[!', '[^') for white in whitelist)
+
+        for black in blacklist:
+
+            clauses.append('class_name NOT GLOB ?')
+
+            params.append(black.replace('[!', '[^'))
 
             
 
-        try:
+        query = 'SELECT class_name FROM class_index'
 
-            with open(class_file, 'r', encoding='utf-8') as f:
+        if clauses:
 
-                return f.read()
+            query += ' WHERE ' + ' AND '.join(clauses)
 
-        except Exception as e:
+            
 
-            self.logger.warning(f"Error reading {class_file}: {str(e)}")
+        cursor = self._read_conn().cursor()
 
-            return ""
+        cursor.execute(query, params)
 
+        return {class_name for class_name, in cursor.fetchall()}
 
 
-    def optimize_code_tokens(self, code: str) -> str:
 
-        """Optimize code to reduce token count while preserving functionality."""
+    def get_optimized_content(self, class_name: str) -> Tuple[str, int]:
 
-        # Remove unnecessary whitespace
+        """Get the optimized content of a class and its token count."""
 
-        code = re.sub(r'\s+', ' ', code)
+        indexed_name = self._resolve_class_name(class_name)
 
-        code = re.sub(r'\s*{\s*', '{', code)
+        if not indexed_name:
 
-        code = re.sub(r'\s*}\s*', '}', code)
+            self.logger.warning(f"Class file not found for {class_name}")
 
-        
+            return "", 0
+
+            
 
-        # Remove comments
+        cursor = self._read_conn().cursor()
 
-        code = re.sub(r'//.*?\n', '\n', code)
+        cursor.execute('SELECT cleaned, token_count FROM class_index WHERE class_name = ?', (indexed_name,))
 
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
+        result = cursor.fetchone()
+
+            
+
+        if not result or result[0] is None:
+
+            return "", 0
+
+        return result[0].decode('utf-8'), result[1]
+
+
+
+    def optimize_code_tokens(self, code: str) -> str:
+
+        """Optimize code to reduce token count while preserving functionality."""
+
+        # Collapse whitespace and comments to a single space in one pass
+
+        code = _RE_CODE_NOISE.sub(lambda m: m.group(1) or ' ', code)
 
         
 
-        # Remove empty lines
+        # Drop the spaces around braces
 
-        code = re.sub(r'\n\s*\n', '\n', code)
+        code = code.replace(' {', '{').replace('{ ', '{').replace(' }', '}').replace('} ', '}')
 
         
 
@@ -652,19 +1268,23 @@ class JadxContextGenerator:
 
         """Calculate approximate token count for Mistral."""
 
-        words = re.findall(r'\w+|[^\w\s]', text)
+        # Count matches without materializing match lists
+
+        words = sum(1 for _ in _RE_TOKEN.finditer(text))
 
-        special_tokens = len(re.findall(r'[{}\[\]()<>]', text))
+        special_tokens = sum(map(text.count, '{}[]()<>'))
 
-        whitespace = len(re.findall(r'\s+', text))
+        whitespace = sum(1 for _ in _RE_WS.finditer(text))
 
-        return int((len(words) + special_tokens + whitespace) * 1.2)
+        return int((words + special_tokens + whitespace) * 1.2)
 
 
 
-    def generate_context(self, target_class: str, whitelist: List[str] = None, blacklist: List[str] = None) -> str:
+    def generate_context(self, target_class: str, whitelist: List[str] = None, blacklist: List[str] = None,
 
-        """Generate context for the target class with package filtering."""
+                         *, out: TextIO, max_workers: int = 8) -> int:
+
+        """Write context for the target class to out and return its token count."""
 
         if whitelist is None:
 
@@ -678,77 +1298,105 @@ class JadxContextGenerator:
 
         self.logger.info(f"Generating context for {target_class}")
 
-        context_parts = []
+        # Use the indexed name so the target is not queued again when referenced
+
+        target_class = self._resolve_class_name(target_class) or target_class
+
+        # Related classes are filtered in SQL up front, the target with fnmatch
+
+        allowed_classes = self.get_allowed_classes(whitelist, blacklist)
 
         processed_classes = set()
 
-        classes_to_process = [target_class]
+        classes_to_process = deque()
+
+        if self.matches_package_filter(target_class, whitelist, blacklist):
+
+            classes_to_process.append(target_class)
+
+        # Every class is queued at most once
+
+        enqueued = {target_class}
 
         total_tokens = 0
 
         
 
-        while classes_to_process and total_tokens < self.MAX_TOKENS:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
 
-            current_class = classes_to_process.pop(0)
+            while classes_to_process and total_tokens < self.MAX_TOKENS:
 
-            if current_class in processed_classes:
+                # Take a batch from the front of the queue
 
-                continue
+                batch = []
 
-                
+                while classes_to_process and len(batch) < max_workers * 4:
 
-            # Check package filters
+                    batch.append(classes_to_process.popleft())
 
-            if not self.matches_package_filter(current_class, whitelist, blacklist):
+                        
 
-                continue
+                # Load the batch in parallel, each worker on its own connection, then
 
-                
+                # merge in queue order so the result matches a sequential BFS
 
-            class_content = self.get_class_content(current_class)
+                results = executor.map(self.get_optimized_content, batch)
 
-            if not class_content:
+                for current_class, (optimized_content, tokens_needed) in zip(batch, results):
 
-                continue
+                    if total_tokens >= self.MAX_TOKENS:
 
-                
+                        break
 
-            # Optimize code to reduce tokens
+                    if not optimized_content:
 
-            optimized_content = self.optimize_code_tokens(class_content)
+                        continue
 
-            tokens_needed = self.calculate_tokens(optimized_content)
+                    
 
-            
+                    if total_tokens + tokens_needed <= self.MAX_TOKENS:
 
-            if total_tokens + tokens_needed <= self.MAX_TOKENS:
+                        # Write accepted classes straight away instead of holding them
 
-                context_parts.append(optimized_content)
+                        if total_tokens:
 
-                total_tokens += tokens_needed
+                            out.write("\n\n")
 
-                
+                        out.write(optimized_content)
 
-                # Add related classes to processing queue
+                        total_tokens += tokens_needed
 
-                hierarchy = self.get_class_hierarchy(current_class)
+                        
 
-                classes_to_process.extend(hierarchy['superclasses'])
+                        # Add related classes to processing queue, the hierarchy is only
 
-                classes_to_process.extend(hierarchy['interfaces'])
+                        # built for classes that fit the budget
 
-                classes_to_process.extend(hierarchy['referenced_classes'])
+                        hierarchy = self.get_class_hierarchy(current_class, optimized_content)
 
-                
+                        for related in (hierarchy['superclasses'], hierarchy['interfaces'], hierarchy['referenced_classes']):
+
+                            for cls in related:
+
+                                if cls in allowed_classes and cls not in processed_classes and cls not in enqueued:
+
+                                    enqueued.add(cls)
 
-            processed_classes.add(current_class)
+                                    classes_to_process.append(cls)
+
+                                    
+
+                    processed_classes.add(current_class)
 
             
 
+        # The worker threads have exited, close the connections they opened
+
+        self._close_read_conns(keep_current=True)
+
         self.logger.info(f"Generated context with {total_tokens} tokens from {len(processed_classes)} classes")
 
-        return "\n\n".join(context_parts)
+        return total_tokens
 
 
 
@@ -756,13 +1404,17 @@ class JadxContextGenerator:
 
         """Cleanup temporary files and database."""
 
+        self._close_read_conns()
+
         if self.conn:
 
             self.conn.close()
 
-        if os.path.exists(self.index_db):
+        for db_file in (self.index_db, self.index_db + "-wal", self.index_db + "-shm"):
+
+            if os.path.exists(db_file):
 
-            os.remove(self.index_db)
+                os.remove(db_file)
 
         if os.path.exists(self.output_dir):
 
@@ -824,33 +1476,45 @@ def main():
 
             
 
-        context = generator.generate_context(
-
-            target_class=args.target_class,
+        if args.output:
 
-            whitelist=args.whitelist,
+            with open(args.output, 'w', encoding='utf-8') as f:
 
-            blacklist=args.blacklist
+                total_tokens = generator.generate_context(
 
-        )
+                    target_class=args.target_class,
 
-        
+                    out=f,
 
-        if args.output:
+                    whitelist=args.whitelist,
 
-            with open(args.output, 'w', encoding='utf-8') as f:
+                    blacklist=args.blacklist
 
-                f.write(context)
+                )
 
             print(f"Context written to {args.output}")
 
         else:
 
-            print(context)
+            context = io.StringIO()
+
+            total_tokens = generator.generate_context(
+
+                target_class=args.target_class,
+
+                out=context,
+
+                whitelist=args.whitelist,
+
+                blacklist=args.blacklist
+
+            )
+
+            print(context.getvalue())
 
         
 
-        print(f"Generated context with {generator.calculate_tokens(context)} tokens")
+        print(f"Generated context with {total_tokens} tokens")
 
     except Exception as e:
 